@@ -1,22 +1,155 @@
+import os
+
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 
+from shared import custom_colors, load_data, per_file_agg, precompute_agg, sidebar_options
 
 
 
-# Load your data (replace with actual file path or source)
-data = pd.read_csv("cleaned.csv")
 
-# Clean column names
-cols = [col.strip() for col in data.columns]
-data.columns = cols
+# Format total cost to shorthand (e.g. 22M)
+def format_shorthand(value):
+    if value >= 1_000_000_000:
+        return f"${value/1_000_000_000:.1f}B"
+    elif value >= 1_000_000:
+        return f"${value/1_000_000:.1f}M"
+    elif value >= 1_000:
+        return f"${value/1_000:.1f}K"
+    else:
+        return f"${value:.0f}"
 
-# Convert total to numeric if not already
-data['total_mat_lab_equip'] = pd.to_numeric(data['total_mat_lab_equip'], errors='coerce')
+# Same formatting as format_shorthand, applied to a whole array of values
+def format_shorthand_vec(values):
+    values = np.asarray(values, dtype=float)
+    conditions = [values >= 1_000_000_000, values >= 1_000_000, values >= 1_000]
+    scaled = np.select(conditions, [values / 1_000_000_000, values / 1_000_000, values / 1_000], values)
+    suffix = np.select(conditions, ['B', 'M', 'K'], '')
+    text = np.where(suffix == '', np.char.mod('$%.0f', scaled), np.char.mod('$%.1f', scaled))
+    return np.char.add(text, suffix)
+
+# Apply the sidebar filters to a precomputed aggregate
+def filter_agg(df, selected_project, selected_category):
+    if selected_project:
+        df = df[df['project_category'].isin(selected_project)]
+    if selected_category:
+        df = df[df['construction_category'].isin(selected_category)]
+    return df
+
+# Sum a value per category of a categorical key in one bincount pass
+def sum_by_category(df, key, value):
+    codes = df[key].cat.codes.to_numpy()
+    values = np.nan_to_num(df[value].to_numpy(), nan=0.0)
+    categories = df[key].cat.categories
+    codes, values = codes[codes >= 0], values[codes >= 0]
+    sums = np.bincount(codes, weights=values, minlength=len(categories))
+    observed = np.zeros(len(categories), dtype=bool)
+    observed[codes] = True
+    return pd.DataFrame({key: categories[observed], value: sums[observed]})
+
+# Bin on the server so Plotly receives one bar per bin instead of every value
+def binned_histogram(values, bins, **kwargs):
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        # px.bar rejects empty x/y lists, so pass an empty frame with named columns
+        return px.bar(pd.DataFrame({'x': [], 'y': []}), x='x', y='y', **kwargs)
+    counts, edges = np.histogram(values, bins=bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    fig = px.bar(x=centers, y=counts, **kwargs)
+    # Size each bar to its bin and hover the bin range, as px.histogram does
+    labels = kwargs.get('labels', {})
+    fig.update_traces(
+        width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate=f"{labels.get('x', 'x')}=%{{customdata[0]:,.0f}}–%{{customdata[1]:,.0f}}"
+                      f"<br>{labels.get('y', 'count')}=%{{y}}<extra></extra>"
+    )
+    fig.update_layout(bargap=0)
+    return fig
+
+# Charts built from the category aggregate are cached per data file version
+# (data_key) and filter selection, so reruns that leave both unchanged re-emit
+# the same figure
+@st.cache_data
+def build_cost_by_construction_fig(data_key, filter_key, _agg):
+    grouped_by_category = (
+        _agg.groupby('construction_category', observed=True, sort=False)['total']
+        .sum()
+        .reset_index(name='total_mat_lab_equip')
+        .sort_values(by='total_mat_lab_equip', ascending=False)
+    )
+    fig1 = px.bar(grouped_by_category, x='construction_category', y='total_mat_lab_equip',
+                  text=format_shorthand_vec(grouped_by_category['total_mat_lab_equip']),
+                  title="Total Cost by Construction Category",
+                  labels={'total_mat_lab_equip': 'Total Cost', 'construction_category': 'Construction Category'},
+                  color_discrete_sequence=custom_colors)
+    fig1.update_traces(texttemplate='%{text}')
+    return fig1
+
+@st.cache_data
+def build_cost_by_project_fig(data_key, filter_key, _agg):
+    grouped_by_proj_cat = (
+        _agg.groupby('project_category', observed=True, sort=False)['total']
+        .sum()
+        .reset_index(name='total_mat_lab_equip')
+        .sort_values(by='total_mat_lab_equip', ascending=False)
+    )
+    fig2 = px.bar(grouped_by_proj_cat, x='project_category', y='total_mat_lab_equip',
+                  text=format_shorthand_vec(grouped_by_proj_cat['total_mat_lab_equip']),
+                  title="Total Cost by Project Category",
+                  labels={'total_mat_lab_equip': 'Total Cost', 'project_category': 'Project Category'},
+                  color_discrete_sequence=custom_colors)
+    fig2.update_traces(texttemplate='%{text}')
+    return fig2
 
-# Custom color palette
-custom_colors = ['#0c2340', '#e07c00', '#7c7c7c', '#b2b2b2', '#cccccc']
+@st.cache_data
+def build_count_by_project_fig(data_key, filter_key, _agg):
+    count_by_project_category = (
+        _agg.groupby('project_category', observed=True, sort=False)['n']
+        .sum()
+        .reset_index(name='count')
+        .sort_values(by='count', ascending=False)
+    )
+    fig4 = px.bar(count_by_project_category, x='project_category', y='count',
+                 title="Line Item Count by Project Category",
+                 color_discrete_sequence=custom_colors)
+    fig4.update_layout(
+        yaxis_title="Line Item Count",
+        xaxis_title="Project Category"
+    )
+    return fig4
+
+# Needs per-file counts, so it is built from the filtered rows, but is still
+# cached per data file version and filter selection so the two-level groupby
+# only reruns on change
+@st.cache_data
+def build_avg_line_items_fig(data_key, filter_key, _filtered_data):
+    avg_df = _filtered_data.groupby(['project_category', 'file_name'], observed=True, sort=False)['total_mat_lab_equip'].count().reset_index()
+    avg_df = avg_df.groupby('project_category', observed=True, sort=False)['total_mat_lab_equip'].mean().reset_index()
+    avg_df.columns = ['project_category', 'avg_line_item_count']
+    avg_df = avg_df.sort_values(by='avg_line_item_count', ascending=False)
+    fig3 = px.bar(avg_df, x='project_category', y='avg_line_item_count',
+                 title="Avg Line Item Count by Project Category",
+                 color_discrete_sequence=custom_colors)
+    fig3.update_layout(
+        yaxis_title="Avg Line Item Count",
+        xaxis_title="Project Category"
+    )
+    return fig3
+
+# Cached per data file version and filter selection, like the charts above
+@st.cache_data
+def build_cost_by_file_fig(data_key, filter_key, _filtered_data):
+    cost_by_file_hist = sum_by_category(_filtered_data, 'file_name', 'total_mat_lab_equip')
+    fig_hist_source = binned_histogram(cost_by_file_hist['total_mat_lab_equip'].to_numpy(), bins='sturges',
+                                       range_x=[0, cost_by_file_hist['total_mat_lab_equip'].max()],
+                                       labels={'x': 'Total Cost', 'y': 'count'},
+                                       color_discrete_sequence=custom_colors)
+    fig_hist_source.update_xaxes(rangebreaks=[dict(bounds=[0, 1])])
+    return fig_hist_source
 
 # Set page configuration
 st.set_page_config(
@@ -37,42 +170,45 @@ with col_logo:
         use_container_width=True
     )
 
+data_path = "cleaned.csv"
+data_mtime = os.path.getmtime(data_path)
+data = load_data(data_path, data_mtime)
+
 # Sidebar filters
+options = sidebar_options(data_path, data_mtime)
 with st.sidebar:
     st.header("Filters")
-    selected_project = st.multiselect("Project Category", options=data['project_category'].unique())
-    selected_category = st.multiselect("Construction Category", options=data['construction_category'].dropna().unique())
+    selected_project = st.multiselect("Project Category", options=options['project_category'])
+    selected_category = st.multiselect("Construction Category", options=options['construction_category'])
 
-# Apply filters
-filtered_data = data.copy()
+# Apply filters as one boolean mask and keep only the columns the charts use
+mask = np.ones(len(data), dtype=bool)
 if selected_project:
-    filtered_data = filtered_data[filtered_data['project_category'].isin(selected_project)]
+    mask &= data['project_category'].isin(selected_project).to_numpy()
 if selected_category:
-    filtered_data = filtered_data[filtered_data['construction_category'].isin(selected_category)]
+    mask &= data['construction_category'].isin(selected_category).to_numpy()
+filtered_data = data.loc[mask, ['project_category', 'file_name', 'total_mat_lab_equip']]
+
+data_key = (data_path, data_mtime)
+filter_key = (tuple(sorted(selected_project)), tuple(sorted(selected_category)))
+
+agg = filter_agg(precompute_agg(data_path, data_mtime), selected_project, selected_category)
 
 st.markdown("---")
 # Summary statistics
 st.subheader("Summary")
 col_summary1, col_summary2, col_summary3 = st.columns(3)
 
-# Format total cost to shorthand (e.g. 22M)
-def format_shorthand(value):
-    if value >= 1_000_000_000:
-        return f"${value/1_000_000_000:.1f}B"
-    elif value >= 1_000_000:
-        return f"${value/1_000_000:.1f}M"
-    elif value >= 1_000:
-        return f"${value/1_000:.1f}K"
-    else:
-        return f"${value:.0f}"
-
-total_cost = filtered_data['total_mat_lab_equip'].sum()
+total_cost = agg['total'].sum()
+# Count distinct projects from the category codes selected by the filter mask
+project_codes = data['source_file_name'].cat.codes.to_numpy()[mask]
+project_count = np.unique(project_codes[project_codes >= 0]).size
 with col_summary1:
     st.markdown(f"<div style='text-align: center;'><h5>Total Cost</h5><h3>{format_shorthand(total_cost)}</h3></div>", unsafe_allow_html=True)
 with col_summary2:
-    st.markdown(f"<div style='text-align: center;'><h5># of Projects</h5><h3>{len(filtered_data.source_file_name.unique()):,}</h3></div>", unsafe_allow_html=True)
+    st.markdown(f"<div style='text-align: center;'><h5># of Projects</h5><h3>{project_count:,}</h3></div>", unsafe_allow_html=True)
 with col_summary3:
-    st.markdown(f"<div style='text-align: center;'><h5># of Items</h5><h3>{len(filtered_data):,}</h3></div>", unsafe_allow_html=True)
+    st.markdown(f"<div style='text-align: center;'><h5># of Items</h5><h3>{agg['n'].sum():,}</h3></div>", unsafe_allow_html=True)
 
 # markedown separator line 
 st.markdown("---")
@@ -83,42 +219,18 @@ col1, col2 = st.columns(2)
 
 # Group by construction category
 with col1:
-    grouped_by_category = (
-        filtered_data.groupby('construction_category')['total_mat_lab_equip']
-        .sum()
-        .reset_index()
-        .sort_values(by='total_mat_lab_equip', ascending=False)
-    )
-    fig1 = px.bar(grouped_by_category, x='construction_category', y='total_mat_lab_equip',
-                  title="Total Cost by Construction Category",
-                  labels={'total_mat_lab_equip': 'Total Cost', 'construction_category': 'Construction Category'},
-                  color_discrete_sequence=custom_colors)
+    fig1 = build_cost_by_construction_fig(data_key, filter_key, agg)
     st.plotly_chart(fig1, use_container_width=True)
 
 # Group by project category
 with col2:
-    grouped_by_proj_cat = (
-        filtered_data.groupby('project_category')['total_mat_lab_equip']
-        .sum()
-        .reset_index()
-        .sort_values(by='total_mat_lab_equip', ascending=False)
-    )
-    fig2 = px.bar(grouped_by_proj_cat, x='project_category', y='total_mat_lab_equip',
-                  title="Total Cost by Project Category",
-                  labels={'total_mat_lab_equip': 'Total Cost', 'project_category': 'Project Category'},
-                  color_discrete_sequence=custom_colors)
+    fig2 = build_cost_by_project_fig(data_key, filter_key, agg)
     st.plotly_chart(fig2, use_container_width=True)
 
 # Total cost per source file
 
 st.subheader("Total Cost by Project")
-cost_by_file_hist = filtered_data.groupby('file_name')['total_mat_lab_equip'].sum().reset_index()
-fig_hist_source = px.histogram(cost_by_file_hist, x='total_mat_lab_equip',
-                            histnorm=None,
-                            range_x=[0, cost_by_file_hist['total_mat_lab_equip'].max()],
-                            labels={'total_mat_lab_equip': 'Total Cost'},
-                            color_discrete_sequence=custom_colors)
-fig_hist_source.update_xaxes(rangebreaks=[dict(bounds=[0, 1])])
+fig_hist_source = build_cost_by_file_fig(data_key, filter_key, filtered_data)
 st.plotly_chart(fig_hist_source, use_container_width=True)
 
 
@@ -128,29 +240,11 @@ st.subheader("Count of Line Items by Categories")
 col3, col4 = st.columns(2)
 
 with col4:
-    avg_df = filtered_data.groupby(['project_category', 'file_name'])['total_mat_lab_equip'].count().reset_index()
-    avg_df = avg_df.groupby('project_category')['total_mat_lab_equip'].mean().reset_index()
-    avg_df.columns = ['project_category', 'avg_line_item_count']
-    avg_df = avg_df.sort_values(by='avg_line_item_count', ascending=False)
-    fig3 = px.bar(avg_df, x='project_category', y='avg_line_item_count',
-                 title="Avg Line Item Count by Project Category",
-                 color_discrete_sequence=custom_colors)
-    fig3.update_layout(
-        yaxis_title="Avg Line Item Count",
-        xaxis_title="Project Category"
-    )
+    fig3 = build_avg_line_items_fig(data_key, filter_key, filtered_data)
     st.plotly_chart(fig3, use_container_width=True)
 
 with col3:
-    count_by_project_category = filtered_data['project_category'].value_counts().reset_index()
-    count_by_project_category.columns = ['project_category', 'count']
-    fig4 = px.bar(count_by_project_category, x='project_category', y='count',
-                 title="Line Item Count by Project Category",
-                 color_discrete_sequence=custom_colors)
-    fig4.update_layout(
-        yaxis_title="Line Item Count",
-        xaxis_title="Project Category"
-    )
+    fig4 = build_count_by_project_fig(data_key, filter_key, agg)
     st.plotly_chart(fig4, use_container_width=True)
 
 
@@ -158,19 +252,15 @@ st.markdown("---")
 # ----- Section 3: Cost vs. Line Item Count -----
 st.subheader("Cost vs. Line Item Count")
 
-cost_vs_count = filtered_data.groupby('project_id').agg(
-    total_cost=('total_mat_lab_equip', 'sum'),
-    line_item_count=('id', 'count')
-).reset_index()
-
 col5, col6 = st.columns(2)
 
 with col5:
-    filtered_data_outliers_1 = filtered_data[filtered_data['total_mat_lab_equip'] < 10000000]
-    fig = px.histogram(filtered_data_outliers_1, x="total_mat_lab_equip", nbins=15, 
-                       color_discrete_sequence=custom_colors, 
-                       title="Cost Distribution",
-                       labels={"total_mat_lab_equip": "Line Item Cost ($)", "count": "Line Item Count"})
+    # combine the outlier cut with the filter mask and index the raw array once
+    totals = data['total_mat_lab_equip'].to_numpy()
+    fig = binned_histogram(totals[mask & (totals < 10000000)], bins=15,
+                           color_discrete_sequence=custom_colors,
+                           title="Cost Distribution",
+                           labels={"x": "Line Item Cost ($)", "y": "Line Item Count"})
     fig.update_layout(
         yaxis_title="Line Item Count",
         xaxis_title="Total Cost ($)"
@@ -179,19 +269,25 @@ with col5:
 
 with col6:
     # remove top 10 outliers
-    filtered_data_outliers = filtered_data[filtered_data['total_mat_lab_equip'] < 1000000000]
-    df_grouped = filtered_data_outliers.groupby("source_file_name").agg(
-        total_mat_lab_equip=("total_mat_lab_equip", "sum"),
-        line_items=("source_file_name", "count")
-    ).reset_index()
-
-    fig = px.scatter(df_grouped, x="line_items", y="total_mat_lab_equip", 
-                     title="Project Cost vs Line Item Count",
-                     labels={"line_items": "Plot Index", "total_mat_lab_equip": "Total Cost ($)"},
-                     color_discrete_sequence=custom_colors)
+    df_grouped = (
+        filter_agg(per_file_agg(data_path, data_mtime, 1000000000), selected_project, selected_category)
+        .groupby("source_file_name", observed=True, sort=False)[["total_mat_lab_equip", "line_items"]]
+        .sum()
+        .reset_index()
+    )
+
+    # Build the trace straight from the arrays rather than through px's DataFrame dispatch;
+    # switch to WebGL once there are too many points for SVG to render smoothly
+    scatter = go.Scattergl if len(df_grouped) > 1000 else go.Scatter
+    fig = go.Figure(scatter(x=df_grouped["line_items"].to_numpy(), y=df_grouped["total_mat_lab_equip"].to_numpy(),
+                            mode="markers", marker_color=custom_colors[0],
+                            hovertemplate="Plot Index=%{x}<br>Total Cost ($)=%{y}<extra></extra>"))
+    fig.update_layout(title="Project Cost vs Line Item Count",
+                      xaxis_title="Plot Index",
+                      yaxis_title="Total Cost ($)")
     st.plotly_chart(fig, use_container_width=True)
 
 # Table preview in expandable section
 st.subheader("Data Preview")
 with st.expander("🔍 View Raw Data Table"):
-    st.dataframe(filtered_data.head(50))
+    st.dataframe(data.iloc[np.flatnonzero(mask)[:50]])
@@ -0,0 +1,55 @@
+import streamlit as st
+import pandas as pd
+
+
+# Group-by / filter keys, stored as categoricals
+category_columns = ['construction_category', 'project_category', 'source_file_name', 'file_name', 'project_id']
+
+# Columns read from the CSV; project_type_id is always empty and never used
+# so it is skipped at parse time
+use_columns = ['description', 'quantity', 'unit', 'total_mat_lab_equip', 'project_id', 'source_file_name',
+               'project_category', 'construction_category', 'id', 'file_name']
+
+# Load your data once per session; reruns reuse the cached DataFrame. mtime is
+# unused in the body but is part of the cache key, so a rewritten CSV is re-read
+@st.cache_data(ttl=None, persist="disk")
+def load_data(path, mtime):
+    # PyArrow parses multi-threaded; declaring dtypes up front skips the
+    # separate numeric coercion pass, and categorical group keys let every
+    # groupby on them work on integer codes instead of Python strings
+    dtypes = {'total_mat_lab_equip': 'float64'}
+    dtypes.update({col: 'category' for col in category_columns})
+    return pd.read_csv(path, engine="pyarrow", usecols=use_columns, dtype=dtypes)
+
+# Sidebar multiselect options, read from the categoricals' category lists
+@st.cache_data(ttl=None, persist="disk")
+def sidebar_options(path, mtime):
+    df = load_data(path, mtime)
+    return {col: df[col].cat.categories.tolist() for col in ['project_category', 'construction_category']}
+
+# Cost and line item totals per (project category, construction category);
+# the category filters only subset these keys, so charts built on them can
+# slice this small table instead of regrouping every row
+@st.cache_data(ttl=None, persist="disk")
+def precompute_agg(path, mtime):
+    df = load_data(path, mtime)
+    # dropna=False keeps rows with a missing category in the totals and counts
+    return df.groupby(['project_category', 'construction_category'], observed=True, dropna=False).agg(
+        total=('total_mat_lab_equip', 'sum'),
+        n=('id', 'size')
+    ).reset_index()
+
+# Per-project cost and line item count, still keyed by the two category
+# filters so the dashboard can slice it; line items at or above
+# max_item_cost are dropped before summing
+@st.cache_data(ttl=None, persist="disk")
+def per_file_agg(path, mtime, max_item_cost):
+    df = load_data(path, mtime)
+    df = df[df['total_mat_lab_equip'] < max_item_cost]
+    return df.groupby(['project_category', 'construction_category', 'source_file_name'], observed=True, dropna=False).agg(
+        total_mat_lab_equip=('total_mat_lab_equip', 'sum'),
+        line_items=('source_file_name', 'count')
+    ).reset_index()
+
+# Custom color palette
+custom_colors = ['#0c2340', '#e07c00', '#7c7c7c', '#b2b2b2', '#cccccc']